@@ -0,0 +1,216 @@
+import os
+import math
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from collections import OrderedDict
+from flask import jsonify
+from models.profiles import get_profile
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Returns (allowed, seconds until the next token)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0
+        return False, (1 - self.tokens) / self.rate
+
+
+class UserRateLimiter:
+    """
+    One token bucket per user id, with LRU eviction so idle users don't pile up.
+    A rate of 0 (or less) disables the limit.
+    """
+
+    def __init__(self, per_minute, burst, max_users=10000):
+        self.rate = per_minute / 60.0
+        self.enabled = self.rate > 0
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, user_id):
+        if not self.enabled:
+            return True, 0
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[user_id] = bucket
+                if len(self._buckets) > self.max_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+            return bucket.take()
+
+    def refund(self, user_id):
+        """Gives back a token taken by a request that was then rejected for another reason."""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is not None:
+                bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+
+
+class ConcurrencyLimiter:
+    """
+    Caps in-flight requests. When all slots are taken, up to `max_waiting`
+    callers may wait up to `max_wait` seconds for one; anyone beyond that is
+    rejected at once, so waiting requests can't pile up and hold threads.
+    Tracks a moving average of service time to suggest a Retry-After value.
+    """
+
+    def __init__(self, limit, max_wait, max_waiting):
+        self.limit = limit
+        self.max_wait = max_wait
+        self.max_waiting = max_waiting
+        self._slots = threading.BoundedSemaphore(limit)
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._avg_duration = 1.0
+
+    def acquire(self):
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                return False
+            self._waiting += 1
+        try:
+            return self._slots.acquire(timeout=self.max_wait)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self, duration=None):
+        if duration is not None:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        self._slots.release()
+
+    def retry_after(self):
+        return max(1, math.ceil(self._avg_duration))
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _default_heavy_budget():
+    """
+    How many DenseNet forward passes may run at once. Each one uses the server
+    profile's intra-op threads, so the budget is the number of such passes
+    that fit in all cores but one. On one- or two-core hosts (or profiles using
+    every core) this is 1 and nothing is held back.
+    """
+    cpus = os.cpu_count() or 1
+    try:
+        _, profile = get_profile()
+        threads = min(profile["intra_op_threads"] or cpus, cpus)
+    except KeyError:
+        threads = cpus
+    return max(1, (cpus - 1) // threads)
+
+
+# CPU budget for model inference only. It is taken around the forward pass via
+# inference_slot(), not for whole requests, so Groq calls never hold it.
+HEAVY_LIMITER = ConcurrencyLimiter(
+    limit=_env_int('HEAVY_MAX_CONCURRENCY', _default_heavy_budget()),
+    max_wait=_env_int('HEAVY_MAX_WAIT', 10),
+    max_waiting=_env_int('HEAVY_MAX_QUEUE', 2 * _default_heavy_budget()),
+)
+
+
+def _reject(status, message, retry_after):
+    return jsonify({'error': message, 'retry_after': retry_after}), status, {'Retry-After': str(retry_after)}
+
+
+class ServerBusy(Exception):
+    """Raised by inference_slot() when no inference capacity frees up in time."""
+
+    def __init__(self, retry_after):
+        super().__init__('Server is busy, try again shortly')
+        self.retry_after = retry_after
+
+    def response(self):
+        return _reject(503, str(self), self.retry_after)
+
+
+@contextmanager
+def inference_slot():
+    """Holds one slot of the shared inference budget for the enclosed model call."""
+    if not HEAVY_LIMITER.acquire():
+        raise ServerBusy(HEAVY_LIMITER.retry_after())
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        HEAVY_LIMITER.release(time.monotonic() - started)
+
+
+def admission_control(name, concurrency, per_minute, burst, max_wait=5, max_queue=None):
+    """
+    Decorator for expensive endpoints; place it under @token_required so the
+    user id is available. Applies the per-user token bucket, then the
+    per-endpoint concurrency limit with a bounded wait queue (default: as many
+    waiters as slots). Limits can be overridden with <NAME>_MAX_CONCURRENCY,
+    <NAME>_RATE_PER_MINUTE, <NAME>_BURST, <NAME>_MAX_WAIT and <NAME>_MAX_QUEUE
+    environment variables. A request turned away as busy gets its rate-limit
+    token back.
+
+    This assumes a threaded server where each request holds a worker thread
+    while it waits (Werkzeug's threaded server, gunicorn gthread, ...). Light
+    routes are not limited, and at most the sum of all endpoint and
+    HEAVY_MAX_QUEUE queues can be waiting at once. On a fixed-size thread pool,
+    size the pool above that sum plus the endpoints' concurrency so light
+    routes always find a free thread.
+    """
+    prefix = name.upper()
+    rate_limiter = UserRateLimiter(
+        per_minute=_env_int(f'{prefix}_RATE_PER_MINUTE', per_minute),
+        burst=_env_int(f'{prefix}_BURST', burst),
+    )
+    endpoint_limiter = ConcurrencyLimiter(
+        limit=_env_int(f'{prefix}_MAX_CONCURRENCY', concurrency),
+        max_wait=_env_int(f'{prefix}_MAX_WAIT', max_wait),
+        max_waiting=_env_int(f'{prefix}_MAX_QUEUE', concurrency if max_queue is None else max_queue),
+    )
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            allowed, wait = rate_limiter.take(current_user)
+            if not allowed:
+                return _reject(429, f'Rate limit exceeded for {name}', max(1, math.ceil(wait)))
+
+            if not endpoint_limiter.acquire():
+                rate_limiter.refund(current_user)
+                return _reject(503, f'{name} is busy, try again shortly', endpoint_limiter.retry_after())
+
+            started = time.monotonic()
+            try:
+                return f(current_user, *args, **kwargs)
+            finally:
+                endpoint_limiter.release(time.monotonic() - started)
+
+        return decorated
+
+    return decorator
@@ -3,15 +3,21 @@ from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 import bcrypt
+import hmac
 import jwt
 import datetime
 from functools import wraps
 from supabase import create_client, Client
 from werkzeug.utils import secure_filename
-from models.model import MedicalDiagnosticSystem
 
+# Load .env before local modules read their settings at import time
 load_dotenv()
 
+from models.model import MedicalDiagnosticSystem, is_summary_error, language_name
+from models.profiles import INFERENCE_PROFILES, describe_profiles
+from admission import admission_control, inference_slot, ServerBusy
+from auth import token_required, find_user_by_email
+
 app = Flask(__name__)
 CORS(app)
 
@@ -36,21 +42,17 @@ UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# JWT Middleware
-def token_required(f):
+# Admin Middleware (shared secret, used for operational endpoints)
+def admin_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('token')
-
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 403
+        admin_token = request.headers.get('admin-token')
+        expected = os.getenv('ADMIN_TOKEN')
 
-        try:
-            data = jwt.decode(token, os.getenv('jwtSecret'), algorithms=["HS256"])
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 403
+        if not expected or not admin_token or not hmac.compare_digest(admin_token.encode('utf-8'), expected.encode('utf-8')):
+            return jsonify({'message': 'Admin token is missing or invalid!'}), 403
 
-        return f(data['user']['id'], *args, **kwargs)
+        return f(*args, **kwargs)
 
     return decorated
 
@@ -66,9 +68,7 @@ def register():
     sex = data.get('sex')
 
     try:
-        existing_user = supabase.table('users').select("*").eq('user_email', email).execute()
-        
-        if existing_user.data and len(existing_user.data) > 0:
+        if find_user_by_email(supabase, email):
             return jsonify("User already exists"), 401
 
         salt = bcrypt.gensalt()
@@ -82,7 +82,13 @@ def register():
             "user_sex": sex
         }
         
-        insert_response = supabase.table('users').insert(new_user_data).execute()
+        try:
+            insert_response = supabase.table('users').insert(new_user_data).execute()
+        except Exception as e:
+            # Unique violation on user_email: a concurrent registration won the race
+            if getattr(e, 'code', None) == '23505':
+                return jsonify("User already exists"), 401
+            raise
         
         if not insert_response.data:
              return jsonify("Failed to create user"), 500
@@ -107,12 +113,10 @@ def login():
     password = data.get('password')
 
     try:
-        user_response = supabase.table('users').select("*").eq('user_email', email).execute()
-        
-        if not user_response.data or len(user_response.data) == 0:
+        user = find_user_by_email(supabase, email, "user_id, user_password")
+
+        if not user:
             return jsonify("Password or Email is incorrect"), 401
-            
-        user = user_response.data[0]
 
         if bcrypt.checkpw(password.encode('utf-8'), user['user_password'].encode('utf-8')):
             token = jwt.encode({
@@ -174,8 +178,62 @@ def get_summary(current_user, summary_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/summaries/<summary_id>/translate', methods=['POST'])
+@token_required
+@admission_control('translate', concurrency=8, per_minute=30, burst=10)
+def translate_summary(current_user, summary_id):
+    """
+    Returns a stored summary in other languages, translated from its canonical
+    analysis. Body: { language } or { languages: [...] } for a single multi-language call.
+    """
+    body = request.get_json() or {}
+    languages = body.get('languages') or [body.get('language', 'English')]
+    if not isinstance(languages, list) or not all(isinstance(l, str) and l for l in languages):
+        return jsonify({'error': 'languages must be a list of language names or codes'}), 400
+
+    try:
+        response = (
+            supabase.table('summaries')
+            .select("summary_id, summary_text, analysis_text, language")
+            .eq('summary_id', summary_id)
+            .eq('user_id', current_user)
+            .single()
+            .execute()
+        )
+        if not response.data:
+            return jsonify({'error': 'Summary not found'}), 404
+
+        analysis = response.data.get('analysis_text')
+        if not analysis:
+            # Rows created before analysis_text existed only hold the summary in its own language
+            analysis = response.data['summary_text']
+            if language_name(response.data.get('language') or 'English') != 'English':
+                analysis = diagnostic_system.translate_summary(analysis, 'English')
+                if is_summary_error(analysis):
+                    print(f"Translate Error (English source): {analysis}")
+                    return jsonify({'error': 'Translation failed for: English'}), 502
+
+        if len(languages) == 1:
+            translations = {languages[0]: diagnostic_system.localize_summary(analysis, languages[0])}
+        else:
+            translations = diagnostic_system.translate_summary_multi(analysis, languages)
+
+        # Don't hand error text to the client as if it were a translation
+        failed = [l for l in languages
+                  if not isinstance(translations.get(l), str) or is_summary_error(translations[l])]
+        if failed:
+            print(f"Translate Error ({', '.join(failed)}): {[translations.get(l) for l in failed]}")
+            return jsonify({'error': f"Translation failed for: {', '.join(failed)}"}), 502
+
+        return jsonify({'summary_id': summary_id, 'translations': translations}), 200
+    except Exception as e:
+        print(f"Translate Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/compare', methods=['POST'])
 @token_required
+@admission_control('compare', concurrency=4, per_minute=10, burst=3)
 def compare_summaries(current_user):
     """
     Accepts a list of summary objects { id, fullText } from the frontend,
@@ -223,12 +281,19 @@ def compare_summaries(current_user):
 
 @app.route('/analyze', methods=['POST'])
 @token_required
+# Endpoint limit covers the Groq calls; the DenseNet pass also takes a shared inference slot
+@admission_control('analyze', concurrency=4, per_minute=6, burst=2, max_wait=15)
 def analyze_medical_report(current_user):
     if 'pdf' not in request.files:
         return jsonify({'error': 'No PDF file part'}), 400
     
     pdf_file = request.files.get('pdf')
 
+    # Optional per-request inference profile ("fast", "balanced", "accurate")
+    profile = request.form.get('profile')
+    if profile and profile not in INFERENCE_PROFILES:
+        return jsonify({'error': f'Unknown inference profile: {profile}'}), 400
+
     pdf_text = None
     image_findings = None
     
@@ -244,17 +309,20 @@ def analyze_medical_report(current_user):
             # Extract Image from PDF
             extracted_image_path = diagnostic_system.extract_images_from_pdf(filepath)
 
-            if extracted_image_path:
-                 extract_img_filename = os.path.basename(extracted_image_path)
-                 print(f"Extracted Image: {extract_img_filename}")
-                 image_findings = diagnostic_system.analyze_image(extracted_image_path)
-                 
-                 # Clean up extracted image
-                 if os.path.exists(extracted_image_path):
-                     os.remove(extracted_image_path)
-            
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            try:
+                if extracted_image_path:
+                     extract_img_filename = os.path.basename(extracted_image_path)
+                     print(f"Extracted Image: {extract_img_filename}")
+                     with inference_slot():
+                         image_findings = diagnostic_system.analyze_image(extracted_image_path, profile)
+            except ServerBusy as e:
+                return e.response()
+            finally:
+                # Clean up extracted image and upload, also when inference was turned away
+                if extracted_image_path and os.path.exists(extracted_image_path):
+                    os.remove(extracted_image_path)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
 
 
 
@@ -264,22 +332,32 @@ def analyze_medical_report(current_user):
 
         # Get language from request (default to English)
         language = request.form.get('language', 'English')
-        summary = diagnostic_system.generate_summary(pdf_text, image_findings, language)
+
+        # The English analysis is the canonical result; other languages are translated from it
+        analysis = diagnostic_system.generate_analysis(pdf_text, image_findings)
+        summary = diagnostic_system.localize_summary(analysis, language)
 
         # Store summary in Supabase
+        summary_id = None
         try:
             summary_data = {
                 "user_id": current_user,
                 "summary_text": summary,
-                "language": language
+                "analysis_text": analysis,
+                "language": language,
+                "model_version": image_findings.get('model_version') if image_findings else None
             }
-            supabase.table('summaries').insert(summary_data).execute()
+            insert_response = supabase.table('summaries').insert(summary_data).execute()
+            if insert_response.data:
+                summary_id = insert_response.data[0]['summary_id']
         except Exception as e:
             print(f"Error saving summary to Supabase: {e}")
             # We continue even if saving fails, as the user still wants the result
 
         return jsonify({
             'summary': summary,
+            'summary_id': summary_id,
+            'language': language,
             'details': image_findings
         })
 
@@ -287,5 +365,37 @@ def analyze_medical_report(current_user):
         print(f"Analysis Error: {e}")
         return jsonify({'error': str(e)}), 500
 
+# --- ADMIN ROUTES ---
+
+@app.route('/admin/models', methods=['GET'])
+@admin_required
+def list_models():
+    """List known model versions and which one is serving traffic."""
+    diagnostic_system.registry.refresh()
+    return jsonify(diagnostic_system.registry.status()), 200
+
+
+@app.route('/admin/models/<version>/activate', methods=['POST'])
+@admin_required
+def activate_model(version):
+    """Load, warm up and swap in a model version in the background."""
+    registry = diagnostic_system.registry
+    registry.refresh()
+
+    if version not in [v['version'] for v in registry.status()['versions']]:
+        return jsonify({'error': f'Unknown model version: {version}'}), 404
+
+    started = registry.activate(version, background=True)
+    if not started:
+        return jsonify({'message': f'Version {version} is already loading'}), 409
+
+    return jsonify({'message': f'Activation of {version} started'}), 202
+
+@app.route('/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    """List inference profiles with their settings, last measured latency/agreement and the run they came from."""
+    return jsonify(dict(describe_profiles(), default=diagnostic_system.profile_name)), 200
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,91 @@
+import os
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict
+import jwt
+from flask import request, jsonify
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Verified tokens are reused for at most this long (and never past their own exp)
+TOKEN_CACHE_TTL = _env_int('TOKEN_CACHE_TTL', 300)
+TOKEN_CACHE_SIZE = _env_int('TOKEN_CACHE_SIZE', 10000)
+
+
+class TokenCache:
+    """Thread-safe LRU of verified JWTs -> user id, with per-entry expiry."""
+
+    def __init__(self, ttl=TOKEN_CACHE_TTL, max_size=TOKEN_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._items.get(token)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._items[token]
+                return None
+            self._items.move_to_end(token)
+            return user_id
+
+    def put(self, token, user_id, exp=None):
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._items[token] = (user_id, expires_at)
+            self._items.move_to_end(token)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+def verify_token(token):
+    """Returns the user id for a valid token, decoding it only on a cache miss. Raises on invalid tokens."""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    data = jwt.decode(token, os.getenv('jwtSecret'), algorithms=["HS256"])
+    user_id = data['user']['id']
+    token_cache.put(token, user_id, data.get('exp'))
+    return user_id
+
+
+# JWT Middleware
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('token')
+
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 403
+
+        try:
+            user_id = verify_token(token)
+        except Exception as e:
+            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 403
+
+        return f(user_id, *args, **kwargs)
+
+    return decorated
+
+
+def find_user_by_email(supabase, email, columns="user_id"):
+    """Looks up one user by email (served by the unique index), selecting only the given columns."""
+    response = supabase.table('users').select(columns).eq('user_email', email).limit(1).execute()
+    return response.data[0] if response.data else None
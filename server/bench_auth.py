@@ -0,0 +1,122 @@
+"""
+Measures per-request auth overhead of token_required, before and after the
+verified-token cache.
+
+    python bench_auth.py [--requests 20000]
+
+The headline number is the verification step timed on its own: jwt.decode
+(the old per-request behaviour) against a hit in auth's token cache.
+
+The same comparison through a Flask test client is printed as well, but the
+client's ~200us per-request cost is far larger than the decode, so those
+end-to-end differences are mostly run-to-run noise.
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import jwt
+from functools import wraps
+from flask import Flask, request, jsonify
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('jwtSecret', 'bench-secret-for-local-measurements-only')
+
+from auth import token_required, token_cache, verify_token
+
+
+def uncached_token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('token')
+
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 403
+
+        try:
+            data = jwt.decode(token, os.getenv('jwtSecret'), algorithms=["HS256"])
+        except Exception as e:
+            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 403
+
+        return f(data['user']['id'], *args, **kwargs)
+
+    return decorated
+
+
+def build_app():
+    app = Flask(__name__)
+
+    @app.route('/none')
+    def no_auth():
+        return jsonify(True)
+
+    @app.route('/uncached')
+    @uncached_token_required
+    def uncached(current_user):
+        return jsonify(True)
+
+    @app.route('/cached')
+    @token_required
+    def cached(current_user):
+        return jsonify(True)
+
+    return app
+
+
+def run(client, path, token, n):
+    headers = {'token': token}
+    started = time.perf_counter()
+    for _ in range(n):
+        response = client.get(path, headers=headers)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_json()
+    return elapsed / n * 1e6
+
+
+def time_call(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark token_required overhead.")
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    token = jwt.encode({
+        'user': {'id': 'bench-user'},
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    }, os.getenv('jwtSecret'), algorithm="HS256")
+
+    client = build_app().test_client()
+    token_cache._items.clear()
+
+    # Warm up routing and the cache
+    for path in ('/none', '/uncached', '/cached'):
+        run(client, path, token, 200)
+
+    secret = os.getenv('jwtSecret')
+    decode_only = time_call(lambda: jwt.decode(token, secret, algorithms=["HS256"]), args.requests)
+    cache_only = time_call(lambda: verify_token(token), args.requests)
+
+    print(f"Verification step ({args.requests} calls):")
+    print(f"{'jwt.decode':<12}{decode_only:>12.2f} us")
+    print(f"{'cache hit':<12}{cache_only:>12.2f} us")
+
+    baseline = run(client, '/none', token, args.requests)
+    uncached = run(client, '/uncached', token, args.requests)
+    cached = run(client, '/cached', token, args.requests)
+
+    print(f"\nFlask test client, end to end (noisy; {args.requests} requests per route):")
+    print(f"{'route':<12}{'us/request':>12}{'auth overhead (us)':>22}")
+    print(f"{'no auth':<12}{baseline:>12.1f}{'-':>22}")
+    print(f"{'uncached':<12}{uncached:>12.1f}{uncached - baseline:>22.1f}")
+    print(f"{'cached':<12}{cached:>12.1f}{cached - baseline:>22.1f}")
+
+
+if __name__ == "__main__":
+    main()
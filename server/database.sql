@@ -12,10 +12,36 @@ CREATE TABLE users(
   user_sex VARCHAR(50)
 );
 
+-- login/register look users up by email
+CREATE UNIQUE INDEX users_user_email_idx ON users(user_email);
+
 CREATE TABLE summaries(
   summary_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
   user_id UUID REFERENCES users(user_id) NOT NULL,
   summary_text TEXT NOT NULL,
+  analysis_text TEXT,
   language VARCHAR(50) DEFAULT 'English',
+  model_version VARCHAR(100),
   created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Results of the offline re-analysis job (reanalyze.py), one row per source report.
+-- Kept apart from summaries so re-runs don't add entries to a user's history.
+CREATE TABLE IF NOT EXISTS reanalysis_results(
+  result_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  user_id UUID REFERENCES users(user_id) NOT NULL,
+  source_path TEXT NOT NULL,
+  summary_id UUID REFERENCES summaries(summary_id),
+  summary_text TEXT NOT NULL,
+  analysis_text TEXT,
+  language VARCHAR(50) DEFAULT 'English',
+  model_version VARCHAR(100),
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (user_id, source_path)
+);
+
+-- Migrations for databases created before these columns existed
+ALTER TABLE summaries ADD COLUMN IF NOT EXISTS model_version VARCHAR(100);
+ALTER TABLE summaries ADD COLUMN IF NOT EXISTS analysis_text TEXT;
+-- Remove duplicate user_email rows first, or this index will fail to build
+CREATE UNIQUE INDEX IF NOT EXISTS users_user_email_idx ON users(user_email);
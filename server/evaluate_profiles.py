@@ -0,0 +1,128 @@
+"""
+Measures latency and agreement for each inference profile.
+
+    python evaluate_profiles.py --images path/to/xrays/ [--reference accurate] [--repeats 3]
+
+For every profile, each image is preprocessed and classified one at a time
+(Grad-CAM excluded). Reports p50/p95 latency and top-1 agreement with the
+reference profile, prints a table and writes models/profile_results.json,
+which /admin/profiles serves next to the profile settings.
+
+Intra-op threads are switched per profile. Inter-op threads are fixed once torch
+starts, so they follow INFERENCE_PROFILE for the whole run.
+
+Latency depends only on the architecture and input size, so --latency-only
+runs can use any DenseNet-121 weights; agreement is then recorded as null
+because it is only meaningful with the fine-tuned weights.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import torch
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models.model import MedicalDiagnosticSystem, CLASS_NAMES
+from models.profiles import INFERENCE_PROFILES, RESULTS_PATH
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def classify(system, model, image, profile):
+    """Preprocess + forward for one image. Returns (class name, confidence)."""
+    tensor = system.get_transform(profile["resolution"])(image).unsqueeze(0).to(system.device)
+    probs = system._predict(model, tensor, profile)
+    confidence, class_idx = torch.max(probs, 1)
+    return CLASS_NAMES[class_idx.item()], confidence.item()
+
+
+def evaluate(system, model, images, profile, repeats):
+    cpus = os.cpu_count() or 1
+    torch.set_num_threads(min(profile["intra_op_threads"] or cpus, cpus))
+
+    # Warm up kernels for this resolution
+    classify(system, model, images[0][1], profile)
+
+    latencies, predictions = [], {}
+    for name, image in images:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            predictions[name] = classify(system, model, image, profile)
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate latency/agreement of inference profiles.")
+    parser.add_argument('--images', required=True, help="Directory of X-ray images")
+    parser.add_argument('--reference', default='accurate', choices=list(INFERENCE_PROFILES))
+    parser.add_argument('--repeats', type=int, default=3, help="Timed runs per image")
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--latency-only', action='store_true',
+                        help="Record latency only (weights are not the fine-tuned ones)")
+    args = parser.parse_args()
+
+    system = MedicalDiagnosticSystem(groq_api_key=None)
+    model_version, model = system.registry.acquire()
+    if model is None:
+        raise SystemExit("Model not loaded; cannot evaluate profiles.")
+
+    images = []
+    for name in sorted(os.listdir(args.images)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            images.append((name, Image.open(os.path.join(args.images, name)).convert('RGB')))
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+
+    # Reference first so every other profile can be compared against it
+    order = [args.reference] + [p for p in INFERENCE_PROFILES if p != args.reference]
+    runs = {name: evaluate(system, model, images, INFERENCE_PROFILES[name], args.repeats) for name in order}
+    reference_predictions = runs[args.reference][1]
+
+    results = {}
+    for name in INFERENCE_PROFILES:
+        latencies, predictions = runs[name]
+        agreement = None
+        if not args.latency_only:
+            agreeing = sum(1 for img, (label, _) in predictions.items() if label == reference_predictions[img][0])
+            agreement = round(agreeing / len(images), 4)
+        results[name] = {
+            "latency_ms_p50": round(percentile(latencies, 50), 2),
+            "latency_ms_p95": round(percentile(latencies, 95), 2),
+            "agreement_with_reference": agreement,
+        }
+
+    print(f"Model {model_version} on {system.device}, {len(images)} image(s), reference = {args.reference}")
+    print(f"{'profile':<10}{'p50 ms':>10}{'p95 ms':>10}{'agreement':>12}")
+    for name, r in results.items():
+        agreement = "n/a" if r['agreement_with_reference'] is None else f"{r['agreement_with_reference']:.1%}"
+        print(f"{name:<10}{r['latency_ms_p50']:>10.1f}{r['latency_ms_p95']:>10.1f}{agreement:>12}")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            "generated_at": datetime.datetime.utcnow().isoformat() + 'Z',
+            "model_version": model_version,
+            "device": str(system.device),
+            "torch_version": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "images": len(images),
+            "repeats": args.repeats,
+            "reference": args.reference,
+            "latency_only": args.latency_only,
+            "profiles": results,
+        }, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import os
 import cv2
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
 import torch
 import torch.nn as nn
@@ -10,33 +13,167 @@ from PIL import Image
 from groq import Groq
 import fitz  # PyMuPDF
 from PyPDF2 import PdfReader
+from models.registry import ModelRegistry
+from models.profiles import get_profile, apply_thread_settings
 
 # Constants
 MODEL_FILENAME = 'densenet121_xray_pytorch_finetuned.pth'
 CLASS_NAMES = ['COVID-19', 'Normal', 'Pneumonia', 'Tuberculosis']
+LANGUAGE_NAMES = {'en': 'English', 'ml': 'Malayalam'}
+SUMMARY_CACHE_SIZE = 512
+
+SUMMARY_FORMAT_RULES = """
+            STRICT FORMATTING RULES:
+            1. PLAIN TEXT ONLY. Do not use markdown (no bold **, no headers #, no bullets -).
+            2. NO Emojis.
+            3. NO Numbered lists for sections.
+            4. Format exactly like the examples below.
+
+            REQUIRED OUTPUT FORMAT:
+
+            Vitals and Lab Data
+            [Medical Term] ([Simple Definition]): [Value] -> [Status]
+            [Medical Term] ([Simple Definition]): [Value] -> [Status]
+
+            X-Ray Findings
+            Condition: [Name]
+            Location: [Location]
+            Meaning: [Explanation]
+
+            Integrated Summary
+            [Detailed paragraph explaining the condition, evidence, and next steps in simple language.]
+"""
+
+
+def language_name(language):
+    """Maps frontend language codes ('en', 'ml') to the names used in prompts."""
+    return LANGUAGE_NAMES.get(language, language)
+
+
+def language_instruction(language):
+    """Output-language rules appended to summary and translation prompts."""
+    if language == "Malayalam":
+        return """
+                OUTPUT LANGUAGE: MALAYALAM (മലയാളം).
+                CRITICAL INSTRUCTION: WRITE IN PURE MALAYALAM SCRIPT.
+                - DO NOT USE MANGLISH (Manglish is strictly forbidden).
+                - DO NOT write English words in Malayalam characters (transliteration). translate the meaning.
+                - Use proper medical terminology in Malayalam where possible, or keep specific medical terms in English brackets if no direct translation exists, e.g., "Pneumonia (ന്യുമോണിയ)".
+                - Provide a detailed and comprehensive explanation, same length as English.
+                - Explain why a value is dangerous.
+                - Use clear and formal Malayalam.
+                """
+    return f"""
+                OUTPUT LANGUAGE: {language.upper()}.
+                - Use clear, simple wording a patient can follow.
+                """
+
+
+def is_summary_error(text):
+    return text.startswith("Groq API Error") or text.startswith("Groq Client not initialized")
+
+
+class SummaryCache:
+    """Thread-safe LRU of generated analyses and translations, keyed by content hash."""
+
+    def __init__(self, max_size=SUMMARY_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
 
 class MedicalDiagnosticSystem:
-    def __init__(self, groq_api_key):
+    def __init__(self, groq_api_key, load_model=True):
         self.groq_api_key = groq_api_key
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = self._load_model()
         self.groq_client = Groq(api_key=groq_api_key) if groq_api_key else None
+        self.summary_cache = SummaryCache()
         
-        # Preprocessing transforms
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-
-    def _load_model(self):
-        """Loads the DenseNet model from the local directory."""
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(current_dir, MODEL_FILENAME)
-        
-        if not os.path.exists(model_path):
-             model_path = os.path.join(os.path.dirname(current_dir), MODEL_FILENAME)
+        # Server-wide inference profile (INFERENCE_PROFILE env); requests may pick another
+        self.profile_name, self.profile = get_profile()
+        apply_thread_settings(self.profile)
+
+        # Preprocessing transforms, one per input resolution
+        self._transforms = {}
 
+        # Versioned weights: the legacy MODEL_FILENAME is registered as "baseline",
+        # further versions come from the manifest in MODEL_REGISTRY_DIR.
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        self.registry = ModelRegistry(
+            loader=self._load_model,
+            warmup=self._warmup_model,
+            weights_dir=os.environ.get('MODEL_REGISTRY_DIR') or os.path.join(current_dir, 'weights'),
+            legacy_paths=[
+                os.path.join(current_dir, MODEL_FILENAME),
+                os.path.join(os.path.dirname(current_dir), MODEL_FILENAME),
+            ],
+        )
+        # load_model=False gives a summary-only instance (e.g. the batch job's parent process)
+        if load_model:
+            default_version = self.registry.default_version()
+            if default_version:
+                self.registry.activate(default_version, background=False)
+            else:
+                print(f"Model file {MODEL_FILENAME} not found.")
+
+    @property
+    def model(self):
+        """The currently active model (None if nothing is loaded)."""
+        return self.registry.acquire()[1]
+
+    @property
+    def model_version(self):
+        return self.registry.acquire()[0]
+
+    def get_transform(self, resolution):
+        """Preprocessing pipeline for a square input resolution (cached)."""
+        if resolution not in self._transforms:
+            self._transforms[resolution] = transforms.Compose([
+                transforms.Resize((resolution, resolution)),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+            ])
+        return self._transforms[resolution]
+
+    def _warmup_model(self, model):
+        """Runs a dummy forward pass so the first real request doesn't pay the cold-start cost."""
+        resolution = self.profile["resolution"]
+        batch = torch.zeros(1, 3, resolution, resolution, device=self.device)
+        self._predict(model, batch, self.profile)
+
+    def _predict(self, model, batch, profile):
+        """
+        Class probabilities for a preprocessed batch under an inference profile.
+        With flip_tta the batch and its mirror go through one forward pass.
+        """
+        with torch.inference_mode():
+            n = batch.shape[0]
+            if profile["flip_tta"]:
+                batch = torch.cat([batch, torch.flip(batch, dims=[3])])
+            if profile["channels_last"]:
+                batch = batch.contiguous(memory_format=torch.channels_last)
+
+            probs = F.softmax(model(batch), dim=1)
+            if profile["flip_tta"]:
+                probs = (probs[:n] + probs[n:]) / 2
+            return probs
+
+    def _load_model(self, model_path):
+        """Loads DenseNet weights from the given file."""
         if os.path.exists(model_path):
             try:
                 print(f"Loading PyTorch model from {model_path}...")
@@ -99,6 +236,8 @@ class MedicalDiagnosticSystem:
                 model.load_state_dict(state_dict)
                 
                 model = model.to(self.device)
+                if self.profile["channels_last"]:
+                    model = model.to(memory_format=torch.channels_last)
                 model.eval()
                 print("Model loaded successfully.")
                 return model
@@ -106,7 +245,7 @@ class MedicalDiagnosticSystem:
                 print(f"Error loading model: {e}")
                 return None
         else:
-            print(f"Model file {MODEL_FILENAME} not found.")
+            print(f"Model file {model_path} not found.")
             return None
 
     def extract_pdf_text(self, pdf_path):
@@ -160,8 +299,12 @@ class MedicalDiagnosticSystem:
             print(f"Error extracting image from PDF: {e}")
             return None
 
-    def _get_gradcam_data(self, img_tensor, original_img):
-        """Generates the heatmap using gradients from the last convolutional layer."""
+    def _get_gradcam_data(self, model, img_tensor, original_img, class_idx):
+        """
+        Generates the heatmap using gradients from the last convolutional layer.
+        `class_idx` is the reported class, so the map explains that prediction
+        even when it came from a different resolution or flip TTA.
+        """
         try:
             # Requires gradients for this specific pass
             img_tensor.requires_grad = True
@@ -170,32 +313,30 @@ class MedicalDiagnosticSystem:
             gradients = []
             activations = []
 
-            def backward_hook(module, grad_input, grad_output):
-                gradients.append(grad_output[0])
-
             def forward_hook(module, input, output):
+                # DenseNet applies an in-place ReLU right after norm5, which breaks a
+                # module backward hook; hook the tensor and pass a copy downstream
                 activations.append(output)
+                output.register_hook(gradients.append)
+                return output.clone()
 
             # Target layer: Last convolutional block of denseblock4
             # In DenseNet121 features, the last block is 'denseblock4' and then 'norm5'
             # We usually use the output of the features part
-            target_layer = self.model.features.norm5
+            target_layer = model.features.norm5
             
             handle_f = target_layer.register_forward_hook(forward_hook)
-            handle_b = target_layer.register_full_backward_hook(backward_hook)
 
             # Forward pass
-            output = self.model(img_tensor)
-            pred_idx = output.argmax(dim=1).item()
-            score = output[:, pred_idx]
+            output = model(img_tensor)
+            score = output[:, class_idx]
 
             # Backward pass
-            self.model.zero_grad()
+            model.zero_grad()
             score.backward()
 
             # Remove hooks
             handle_f.remove()
-            handle_b.remove()
 
             # Get gradients and activations
             grads = gradients[0] # [1, 1024, 7, 7]
@@ -240,26 +381,24 @@ class MedicalDiagnosticSystem:
             print(f"Grad-CAM Error: {e}")
             return "Chest Area"
 
-    def analyze_image(self, image_path):
+    def analyze_image(self, image_path, profile_name=None):
         """Analyzes an X-ray image and returns the findings."""
-        if self.model is None:
+        # Pin the model for this request so a concurrent hot-swap doesn't change it mid-way
+        model_version, model = self.registry.acquire()
+        if model is None:
             return {"error": "Model not loaded"}
 
         try:
+            profile_name, profile = get_profile(profile_name or self.profile_name)
+
             # Load and preprocess image
             img_pil = Image.open(image_path).convert('RGB')
-            img_tensor = self.transform(img_pil).unsqueeze(0).to(self.device) # [1, 3, 224, 224]
+            img_tensor = self.get_transform(profile["resolution"])(img_pil).unsqueeze(0).to(self.device) # [1, 3, H, W]
             original_img = cv2.imread(image_path)
 
-            # Predict
-            with torch.no_grad(): # Use no_grad for inference, but our GradCAM needs grad...
-                # Actually, for standard inference we don't need grad
-                # But to call _get_gradcam_data we might need to re-run with grad enabled if we separate them
-                # Or just run it once with grad enabled if performance allows.
-                # For safety and speed, let's just do a clean forward pass first.
-                outputs = self.model(img_tensor)
-                probs = F.softmax(outputs, dim=1)
-                confidence, class_idx = torch.max(probs, 1)
+            # Predict (gradient-free; Grad-CAM below runs its own pass with gradients)
+            probs = self._predict(model, img_tensor, profile)
+            confidence, class_idx = torch.max(probs, 1)
                 
             confidence = confidence.item()
             class_idx = class_idx.item()
@@ -269,28 +408,9 @@ class MedicalDiagnosticSystem:
             location = "N/A"
             if disease_name != "Normal":
                  # We need to run a pass with gradients enabled for GradCAM
-                 location = self._get_gradcam_data(img_tensor, original_img)
+                 location = self._get_gradcam_data(model, img_tensor, original_img, class_idx)
 
-            json_report = {
-                "overall_status": "Abnormal" if disease_name != "Normal" else "Normal",
-                "findings": []
-            }
-
-            if disease_name != "Normal":
-                json_report["findings"].append({
-                    "condition": disease_name,
-                    "confidence": f"{confidence*100:.1f}%",
-                    "location": location,
-                    "note": "AI detected anomaly using Grad-CAM attention."
-                })
-            else:
-                 json_report["findings"].append({
-                    "condition": "Normal",
-                    "confidence": f"{confidence*100:.1f}%",
-                    "location": "N/A"
-                })
-            
-            return json_report
+            return self._build_report(model_version, profile_name, disease_name, confidence, location)
 
         except Exception as e:
             print(f"Image Analysis Error: {e}")
@@ -298,57 +418,101 @@ class MedicalDiagnosticSystem:
             traceback.print_exc()
             return {"error": str(e)}
 
-    def generate_summary(self, pdf_text, image_findings, target_language="English"):
-        """Generates a detailed summary using Groq."""
-        if not self.groq_client:
-            return "Groq Client not initialized. Check API Key."
+    def analyze_images(self, image_paths, profile_name=None):
+        """Analyzes a batch of X-ray images in one forward pass. Returns one report per path."""
+        model_version, model = self.registry.acquire()
+        if model is None:
+            return [{"error": "Model not loaded"} for _ in image_paths]
+
+        profile_name, profile = get_profile(profile_name or self.profile_name)
+        transform = self.get_transform(profile["resolution"])
+
+        results = [None] * len(image_paths)
+        tensors, originals, indices = [], [], []
+
+        for i, image_path in enumerate(image_paths):
+            try:
+                img_pil = Image.open(image_path).convert('RGB')
+                tensors.append(transform(img_pil))
+                originals.append(cv2.imread(image_path))
+                indices.append(i)
+            except Exception as e:
+                print(f"Image Load Error ({image_path}): {e}")
+                results[i] = {"error": str(e)}
+
+        if not tensors:
+            return results
 
         try:
-            json_string = json.dumps(image_findings, indent=2) if image_findings else "No X-ray analysis provided."
-            pdf_content = pdf_text if pdf_text else "No Medical Report Text provided."
+            batch = torch.stack(tensors).to(self.device) # [N, 3, H, W]
+            probs = self._predict(model, batch, profile)
+            confidences, class_idxs = torch.max(probs, 1)
+
+            for j, i in enumerate(indices):
+                disease_name = CLASS_NAMES[class_idxs[j].item()]
+                location = "N/A"
+                if disease_name != "Normal":
+                    # Grad-CAM needs its own backward pass per image
+                    location = self._get_gradcam_data(model, batch[j:j + 1].clone(), originals[j], class_idxs[j].item())
+                results[i] = self._build_report(model_version, profile_name, disease_name, confidences[j].item(), location)
 
-            if target_language == "ml" or target_language == "Malayalam":
-                lang_instruction = """
-                OUTPUT LANGUAGE: MALAYALAM (മലയാളം).
-                CRITICAL INSTRUCTION: WRITE IN PURE MALAYALAM SCRIPT.
-                - DO NOT USE MANGLISH (Manglish is strictly forbidden).
-                - DO NOT write English words in Malayalam characters (transliteration). translate the meaning.
-                - Use proper medical terminology in Malayalam where possible, or keep specific medical terms in English brackets if no direct translation exists, e.g., "Pneumonia (ന്യുമോണിയ)".
-                - Provide a detailed and comprehensive explanation, same length as English.
-                - Explain why a value is dangerous.
-                - Use clear and formal Malayalam.
-                """
-            else:
-                lang_instruction = """
-                OUTPUT LANGUAGE: ENGLISH.
-                - Provide a detailed layman explanation.
-                - Connect all dots between Vitals and X-Ray.
-                """
+        except Exception as e:
+            print(f"Batch Analysis Error: {e}")
+            for i in indices:
+                results[i] = {"error": str(e)}
+
+        return results
+
+    def _build_report(self, model_version, profile_name, disease_name, confidence, location):
+        """Builds the findings dict passed to the summary prompt and stored with results."""
+        json_report = {
+            "overall_status": "Abnormal" if disease_name != "Normal" else "Normal",
+            "model_version": model_version,
+            "inference_profile": profile_name,
+            "findings": []
+        }
+
+        if disease_name != "Normal":
+            json_report["findings"].append({
+                "condition": disease_name,
+                "confidence": f"{confidence*100:.1f}%",
+                "location": location,
+                "note": "AI detected anomaly using Grad-CAM attention."
+            })
+        else:
+            json_report["findings"].append({
+                "condition": "Normal",
+                "confidence": f"{confidence*100:.1f}%",
+                "location": "N/A"
+            })
 
-            system_instruction = f"""
-            You are an expert doctor explaining a detailed diagnosis to a patient.
+        return json_report
 
-            STRICT FORMATTING RULES:
-            1. PLAIN TEXT ONLY. Do not use markdown (no bold **, no headers #, no bullets -).
-            2. NO Emojis.
-            3. NO Numbered lists for sections.
-            4. Format exactly like the examples below.
+    def generate_analysis(self, pdf_text, image_findings):
+        """
+        Produces the canonical (English) diagnostic summary using Groq.
+        Cached per report content, so other languages never repeat this step.
+        """
+        if not self.groq_client:
+            return "Groq Client not initialized. Check API Key."
 
-            REQUIRED OUTPUT FORMAT:
+        json_string = json.dumps(image_findings, indent=2, sort_keys=True) if image_findings else "No X-ray analysis provided."
+        pdf_content = pdf_text if pdf_text else "No Medical Report Text provided."
 
-            Vitals and Lab Data
-            [Medical Term] ([Simple Definition]): [Value] -> [Status]
-            [Medical Term] ([Simple Definition]): [Value] -> [Status]
+        cache_key = self.report_key(pdf_content, json_string)
+        cached = self.summary_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-            X-Ray Findings
-            Condition: [Name]
-            Location: [Location]
-            Meaning: [Explanation]
+        try:
+            system_instruction = f"""
+            You are an expert doctor explaining a detailed diagnosis to a patient.
 
-            Integrated Summary
-            [Detailed paragraph explaining the condition, evidence, and next steps in simple language.]
+            {SUMMARY_FORMAT_RULES}
 
-            {lang_instruction}
+            OUTPUT LANGUAGE: ENGLISH.
+            - Provide a detailed layman explanation.
+            - Connect all dots between Vitals and X-Ray.
             """
 
             user_message = f"""
@@ -360,7 +524,7 @@ class MedicalDiagnosticSystem:
             --- SOURCE 2: MEDICAL REPORT TEXT ---
             {pdf_content}
 
-            Please generate the Detailed Integrated Summary in {target_language}.
+            Please generate the Detailed Integrated Summary in English.
             """
 
             completion = self.groq_client.chat.completions.create(
@@ -371,11 +535,131 @@ class MedicalDiagnosticSystem:
                 model="llama-3.3-70b-versatile",
                 temperature=0.3,
             )
-            return completion.choices[0].message.content
+            analysis = completion.choices[0].message.content
+            self.summary_cache.put(cache_key, analysis)
+            return analysis
 
         except Exception as e:
             return f"Groq API Error: {e}"
 
+    def localize_summary(self, analysis, target_language):
+        """Returns the analysis in the target language (English passes through unchanged)."""
+        if is_summary_error(analysis) or language_name(target_language) == "English":
+            return analysis
+        return self.translate_summary(analysis, target_language)
+
+    def translate_summary(self, analysis, target_language):
+        """Translates a finished summary. Much cheaper than re-running the analysis."""
+        if not self.groq_client:
+            return "Groq Client not initialized. Check API Key."
+
+        language = language_name(target_language)
+        cache_key = self.report_key(analysis, language)
+        cached = self.summary_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            system_instruction = f"""
+            You are a medical translator. Translate the patient summary you are given.
+            Keep every section, line and value in the same order. Do not add or remove medical content.
+
+            {SUMMARY_FORMAT_RULES}
+
+            {language_instruction(language)}
+            """
+
+            completion = self.groq_client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": system_instruction},
+                    {"role": "user", "content": analysis}
+                ],
+                model="llama-3.3-70b-versatile",
+                temperature=0.2,
+            )
+            translation = completion.choices[0].message.content
+            self.summary_cache.put(cache_key, translation)
+            return translation
+
+        except Exception as e:
+            return f"Groq API Error: {e}"
+
+    def translate_summary_multi(self, analysis, target_languages):
+        """
+        Translates a summary into several languages with a single Groq call.
+        Returns {language: text}; falls back to one call per language if the reply isn't valid JSON.
+        """
+        results = {}
+        missing = []
+        for target in target_languages:
+            language = language_name(target)
+            if language == "English":
+                results[target] = analysis
+                continue
+            cached = self.summary_cache.get(self.report_key(analysis, language))
+            if cached is not None:
+                results[target] = cached
+            else:
+                missing.append(target)
+
+        if not missing or is_summary_error(analysis):
+            return results
+        if len(missing) == 1 or not self.groq_client:
+            for target in missing:
+                results[target] = self.translate_summary(analysis, target)
+            return results
+
+        instructions = "\n".join(language_instruction(language_name(t)) for t in missing)
+        keys = ", ".join(f'"{t}"' for t in missing)
+        system_instruction = f"""
+        You are a medical translator. Translate the patient summary you are given into each requested language.
+        Keep every section, line and value in the same order. Do not add or remove medical content.
+
+        {SUMMARY_FORMAT_RULES}
+
+        {instructions}
+
+        Return ONLY valid JSON (no markdown, no code fences) with exactly these keys: {keys}.
+        Each value is the full translated summary as a plain text string.
+        """
+
+        raw = ""
+        try:
+            completion = self.groq_client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": system_instruction},
+                    {"role": "user", "content": analysis}
+                ],
+                model="llama-3.3-70b-versatile",
+                temperature=0.2,
+            )
+            raw = completion.choices[0].message.content.strip()
+            if raw.startswith("```"):
+                raw = raw.split("```")[1]
+                if raw.startswith("json"):
+                    raw = raw[4:]
+            translations = json.loads(raw)
+            for target in missing:
+                text = translations[target]
+                self.summary_cache.put(self.report_key(analysis, language_name(target)), text)
+                results[target] = text
+        except Exception as e:
+            print(f"Multi-language translation failed, falling back to single calls: {e}")
+            for target in missing:
+                if target not in results:
+                    results[target] = self.translate_summary(analysis, target)
+
+        return results
+
+    @staticmethod
+    def report_key(*parts):
+        """Content hash used to cache analyses and translations per report."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
     def generate_comparison(self, summary_older: str, summary_newer: str) -> dict:
         """
         Compares two medical summaries using Groq and returns a structured JSON analysis.
@@ -0,0 +1,94 @@
+import os
+import json
+import torch
+
+# Test-time inference profiles, trading accuracy for latency.
+#   resolution        square input size fed to DenseNet (it pools adaptively, so any size works)
+#   intra_op_threads  torch.set_num_threads; 0 keeps torch's default
+#   inter_op_threads  torch.set_num_interop_threads; 0 keeps torch's default
+#   channels_last     NHWC memory format, usually faster for convolutions on CPU
+#   flip_tta          average predictions over the image and its horizontal flip (one batched pass)
+INFERENCE_PROFILES = {
+    "fast": {
+        "resolution": 160,
+        "intra_op_threads": 2,
+        "inter_op_threads": 1,
+        "channels_last": True,
+        "flip_tta": False,
+    },
+    "balanced": {
+        "resolution": 224,
+        "intra_op_threads": 4,
+        "inter_op_threads": 1,
+        "channels_last": True,
+        "flip_tta": False,
+    },
+    "accurate": {
+        "resolution": 288,
+        "intra_op_threads": 0,
+        "inter_op_threads": 0,
+        "channels_last": True,
+        "flip_tta": True,
+    },
+}
+DEFAULT_PROFILE = 'balanced'
+
+# Written by evaluate_profiles.py; served by describe_profiles() when present
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profile_results.json')
+
+
+def get_profile(name=None):
+    """Returns (name, settings) for a profile. None means the server default (INFERENCE_PROFILE env)."""
+    name = name or os.environ.get('INFERENCE_PROFILE', DEFAULT_PROFILE)
+    if name not in INFERENCE_PROFILES:
+        raise KeyError(f"Unknown inference profile: {name}")
+    return name, INFERENCE_PROFILES[name]
+
+
+def apply_thread_settings(profile):
+    """
+    Applies a profile's thread counts. These are process-wide in torch, so they
+    follow the server profile only; inter-op threads can only be set before
+    the first parallel op runs.
+    """
+    if profile["intra_op_threads"]:
+        torch.set_num_threads(min(profile["intra_op_threads"], os.cpu_count() or 1))
+    if profile["inter_op_threads"]:
+        try:
+            torch.set_num_interop_threads(profile["inter_op_threads"])
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+
+
+def load_measurements():
+    """The last evaluate_profiles.py run: run metadata plus per-profile numbers under 'profiles'."""
+    if not os.path.exists(RESULTS_PATH):
+        return {}
+    try:
+        with open(RESULTS_PATH) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading profile results: {e}")
+        return {}
+
+
+def describe_profiles():
+    """
+    All profiles with their settings and measured numbers, for the admin endpoint.
+    The run metadata (model version, host, ...) comes alongside; numbers from a
+    latency-only run or without agreement are flagged as provisional.
+    """
+    results = load_measurements()
+    measurements = results.get('profiles', {})
+    run = {key: value for key, value in results.items() if key != 'profiles'} or None
+    if run is not None:
+        run['provisional'] = bool(run.get('latency_only')) or any(
+            m.get('agreement_with_reference') is None for m in measurements.values()
+        )
+    return {
+        "profiles": {
+            name: dict(settings, measured=measurements.get(name))
+            for name, settings in INFERENCE_PROFILES.items()
+        },
+        "measurement_run": run,
+    }
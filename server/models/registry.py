@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+import threading
+import datetime
+
+# Manifest describing the versioned weight files kept in the registry directory.
+# {
+#   "versions": [
+#     {"version": "v2", "filename": "densenet121_v2.pth", "sha256": "<hex digest>"}
+#   ]
+# }
+MANIFEST_FILENAME = 'manifest.json'
+
+# Number of loaded versions kept in memory (active + previous for rollback).
+MAX_LOADED_VERSIONS = 2
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Returns the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Holds versioned DenseNet weight files and the models loaded from them.
+
+    A new version is loaded and warmed up off the request path, then swapped in
+    by replacing a single reference under a lock. Requests grab the active
+    (version, model) pair once via acquire(), so in-flight work finishes on the
+    model it started with even if a swap happens mid-request.
+    """
+
+    def __init__(self, loader, warmup=None, weights_dir=None, legacy_paths=None):
+        self.loader = loader
+        self.warmup = warmup
+        self.weights_dir = weights_dir
+        self.legacy_paths = legacy_paths or []
+
+        self._lock = threading.Lock()
+        self._active = (None, None)  # (version, model)
+        self._loaded = {}            # version -> {"model", "sha256", "loaded_at"}
+        self._pending = {}           # version -> status string for background loads
+        self._versions = self.discover()
+
+    def discover(self):
+        """Reads the manifest and the legacy single-file location into a version table."""
+        versions = {}
+
+        for path in self.legacy_paths:
+            if os.path.exists(path):
+                versions['baseline'] = {"version": "baseline", "path": path, "sha256": None}
+                break
+
+        if self.weights_dir:
+            manifest_path = os.path.join(self.weights_dir, MANIFEST_FILENAME)
+            if os.path.exists(manifest_path):
+                try:
+                    with open(manifest_path) as f:
+                        manifest = json.load(f)
+                    for entry in manifest.get('versions', []):
+                        versions[entry['version']] = {
+                            "version": entry['version'],
+                            "path": os.path.join(self.weights_dir, entry['filename']),
+                            "sha256": entry.get('sha256'),
+                        }
+                except Exception as e:
+                    print(f"Error reading model manifest: {e}")
+
+        return versions
+
+    def refresh(self):
+        """Re-reads the manifest so newly dropped weight files become available."""
+        versions = self.discover()
+        with self._lock:
+            self._versions = versions
+
+    def default_version(self):
+        """Version to serve at startup: MODEL_VERSION env, else the newest manifest entry."""
+        requested = os.environ.get('MODEL_VERSION')
+        if requested and requested in self._versions:
+            return requested
+        if not self._versions:
+            return None
+        return list(self._versions.keys())[-1]
+
+    def acquire(self):
+        """Returns the active (version, model) pair for the duration of one request."""
+        with self._lock:
+            return self._active
+
+    def load(self, version):
+        """Verifies the checksum, loads and warms up a version without activating it."""
+        with self._lock:
+            if version in self._loaded:
+                return self._loaded[version]["model"]
+            entry = self._versions.get(version)
+
+        if entry is None:
+            raise KeyError(f"Unknown model version: {version}")
+        if not os.path.exists(entry["path"]):
+            raise FileNotFoundError(f"Weight file missing for {version}: {entry['path']}")
+
+        checksum = file_sha256(entry["path"])
+        if entry["sha256"] and entry["sha256"].lower() != checksum:
+            raise ValueError(f"Checksum mismatch for {version}: expected {entry['sha256']}, got {checksum}")
+
+        model = self.loader(entry["path"])
+        if model is None:
+            raise RuntimeError(f"Loader failed for {version}")
+        if self.warmup:
+            self.warmup(model)
+
+        with self._lock:
+            self._loaded[version] = {
+                "model": model,
+                "sha256": checksum,
+                "loaded_at": datetime.datetime.utcnow().isoformat() + 'Z',
+            }
+        return model
+
+    def activate(self, version, background=True):
+        """Loads (if needed) and atomically swaps in a version. Returns immediately when background."""
+        if background:
+            with self._lock:
+                if self._pending.get(version) == 'loading':
+                    return False
+                self._pending[version] = 'loading'
+            thread = threading.Thread(target=self._activate, args=(version,), daemon=True)
+            thread.start()
+            return True
+        return self._activate(version)
+
+    def _activate(self, version):
+        try:
+            model = self.load(version)
+        except Exception as e:
+            print(f"Error activating model {version}: {e}")
+            with self._lock:
+                self._pending[version] = f"failed: {e}"
+            return False
+
+        with self._lock:
+            self._active = (version, model)
+            self._pending.pop(version, None)
+            self._evict()
+        print(f"Model version {version} is now active.")
+        return True
+
+    def _evict(self):
+        # Caller holds the lock. Requests that already acquired an evicted model
+        # keep their own reference, so dropping it here is safe.
+        active_version = self._active[0]
+        stale = [v for v in self._loaded if v != active_version]
+        while len(self._loaded) > MAX_LOADED_VERSIONS and stale:
+            del self._loaded[stale.pop(0)]
+
+    def status(self):
+        """Summary of known, loaded and active versions for the admin endpoint."""
+        with self._lock:
+            active_version = self._active[0]
+            versions = []
+            for version, entry in self._versions.items():
+                loaded = self._loaded.get(version)
+                versions.append({
+                    "version": version,
+                    "filename": os.path.basename(entry["path"]),
+                    "sha256": loaded["sha256"] if loaded else entry["sha256"],
+                    "loaded": loaded is not None,
+                    "loaded_at": loaded["loaded_at"] if loaded else None,
+                    "active": version == active_version,
+                    "pending": self._pending.get(version),
+                })
+            return {"active": active_version, "versions": versions}
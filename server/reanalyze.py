@@ -0,0 +1,265 @@
+"""
+Offline bulk re-analysis of archived medical reports.
+
+Recomputes findings and summaries for existing PDFs after a model or prompt
+change, without going through the interactive /analyze endpoint.
+
+    # Every PDF in a directory, attributed to one user
+    python reanalyze.py --input archive/ --user-id <uuid>
+
+    # A manifest of reports, one JSON object per line:
+    # {"path": "archive/a.pdf", "user_id": "<uuid>", "language": "English", "summary_id": "<uuid>"}
+    python reanalyze.py --manifest reports.jsonl
+
+Extraction and DenseNet inference run in batches across a process pool;
+summaries are generated in the parent under a Groq rate limit and upserted to
+the reanalysis_results table in bulk, keyed on (user_id, source_path). Re-runs
+update a report's row in place instead of adding entries to the user's
+/summaries history. A manifest entry may carry the "summary_id" of the
+original summary to link the two. Finished reports are appended to a
+checkpoint file after each successful write, so an interrupted run picks up
+where it stopped (dry runs never touch the checkpoint).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+import torch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+from supabase import create_client
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models.model import MedicalDiagnosticSystem, is_summary_error, language_name
+from models.profiles import INFERENCE_PROFILES
+
+# Per-process model instance, created once by the pool initializer
+_worker_system = None
+
+
+def _init_worker(profile, threads):
+    global _worker_system
+    if profile:
+        # Worker processes pick up resolution and TTA settings from the chosen profile
+        os.environ['INFERENCE_PROFILE'] = profile
+    _worker_system = MedicalDiagnosticSystem(groq_api_key=None)
+    if _worker_system.registry.acquire()[1] is None:
+        # Fails the pool: re-analysing without a model would overwrite good results
+        raise RuntimeError("Model not loaded in worker; aborting re-analysis.")
+    # Split the cores between workers instead of every worker using all of them
+    torch.set_num_threads(threads)
+
+
+def _process_batch(jobs):
+    """Extracts text and X-rays for a batch of reports, then runs one batched forward pass."""
+    results = []
+    image_paths = []
+    image_owners = []
+
+    # Work on copies so extracted images never land in the archive directory
+    work_dir = tempfile.mkdtemp(prefix='reanalyze_')
+    try:
+        for job in jobs:
+            result = dict(job, pdf_text=None, image_findings=None)
+            try:
+                # One sub-directory per report: extracted images are written next to the PDF
+                report_dir = os.path.join(work_dir, str(len(results)))
+                os.makedirs(report_dir)
+                pdf_path = os.path.join(report_dir, os.path.basename(job['path']))
+                shutil.copyfile(job['path'], pdf_path)
+
+                result['pdf_text'] = _worker_system.extract_pdf_text(pdf_path)
+                image_path = _worker_system.extract_images_from_pdf(pdf_path)
+                if image_path:
+                    image_paths.append(image_path)
+                    image_owners.append(len(results))
+            except Exception as e:
+                print(f"Extraction Error ({job['path']}): {e}")
+            results.append(result)
+
+        if image_paths:
+            for owner, findings in zip(image_owners, _worker_system.analyze_images(image_paths)):
+                results[owner]['image_findings'] = findings
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+class RateLimiter:
+    """Spaces out calls so at most `per_minute` happen in any minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self.next_allowed = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_allowed:
+            time.sleep(self.next_allowed - now)
+            now = self.next_allowed
+        self.next_allowed = now + self.interval
+
+
+def load_jobs(args):
+    """Builds the list of {path, user_id, language} jobs from --input or --manifest."""
+    jobs = []
+    if args.manifest:
+        with open(args.manifest) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                jobs.append({
+                    "path": entry['path'],
+                    "user_id": entry.get('user_id', args.user_id),
+                    "language": entry.get('language', args.language),
+                    "summary_id": entry.get('summary_id'),
+                })
+    else:
+        for root, _, files in os.walk(args.input):
+            for name in sorted(files):
+                if name.lower().endswith('.pdf'):
+                    jobs.append({
+                        "path": os.path.join(root, name),
+                        "user_id": args.user_id,
+                        "language": args.language,
+                        "summary_id": None,
+                    })
+
+    # A report listed twice would hit the same (user_id, source_path) row twice in one upsert
+    unique = {}
+    for job in jobs:
+        unique.setdefault((job['user_id'], job['path']), job)
+    jobs = list(unique.values())
+
+    missing_user = [j['path'] for j in jobs if not j['user_id']]
+    if missing_user:
+        raise SystemExit(f"No user_id for {len(missing_user)} report(s), e.g. {missing_user[0]}. Pass --user-id.")
+    return jobs
+
+
+def checkpoint_key(user_id, path):
+    # The same archived PDF can belong to several users, so both identify a finished report
+    return f"{user_id}\t{path}"
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def flush(supabase, rows, done_keys, checkpoint_path, dry_run):
+    """Bulk-upserts pending rows, then records their checkpoint keys."""
+    if not rows:
+        return 0
+    if dry_run:
+        # Nothing was written, so nothing may be marked as done
+        return len(rows)
+    supabase.table('reanalysis_results').upsert(rows, on_conflict='user_id,source_path').execute()
+    with open(checkpoint_path, 'a') as f:
+        for key in done_keys:
+            f.write(key + '\n')
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run extraction, inference and summaries over archived reports.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help="Directory of archived PDF reports")
+    source.add_argument('--manifest', help="JSON-lines manifest of {path, user_id, language, summary_id}")
+    parser.add_argument('--user-id', help="Owner of the reports (default for manifest entries without one)")
+    parser.add_argument('--language', default='English')
+    parser.add_argument('--profile', choices=list(INFERENCE_PROFILES), help="Inference profile; defaults to INFERENCE_PROFILE")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=16, help="Reports per inference batch")
+    parser.add_argument('--write-batch', type=int, default=50, help="Rows per Supabase upsert")
+    parser.add_argument('--summaries-per-minute', type=int, default=30, help="Groq rate limit")
+    parser.add_argument('--checkpoint', default='reanalyze_checkpoint.txt')
+    parser.add_argument('--dry-run', action='store_true', help="Skip Supabase writes and checkpointing")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    jobs = load_jobs(args)
+    done = load_checkpoint(args.checkpoint)
+    pending = [j for j in jobs if checkpoint_key(j['user_id'], j['path']) not in done]
+    print(f"{len(jobs)} report(s) found, {len(jobs) - len(pending)} already done, {len(pending)} to process.")
+    if not pending:
+        return
+
+    supabase = None if args.dry_run else create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    summarizer = MedicalDiagnosticSystem(os.environ.get("GROQ_API_KEY"), load_model=False)
+    limiter = RateLimiter(args.summaries_per_minute)
+
+    batches = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
+    rows, row_keys = [], []
+    written = failed = 0
+    started = time.monotonic()
+
+    threads_per_worker = max(1, (os.cpu_count() or 1) // args.workers)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.profile, threads_per_worker)) as pool:
+        futures = [pool.submit(_process_batch, batch) for batch in batches]
+
+        for future in as_completed(futures):
+            for result in future.result():
+                findings = result['image_findings']
+                if not result['pdf_text'] and not findings:
+                    print(f"Skipping {result['path']}: no valid data extracted")
+                    failed += 1
+                    continue
+                if findings and 'error' in findings:
+                    # Never write or checkpoint a summary built on failed inference
+                    print(f"Inference failed for {result['path']}: {findings['error']}")
+                    failed += 1
+                    continue
+
+                limiter.wait()
+                analysis = summarizer.generate_analysis(result['pdf_text'], findings)
+                summary = analysis
+                if not is_summary_error(analysis) and language_name(result['language']) != "English":
+                    limiter.wait()
+                    summary = summarizer.translate_summary(analysis, result['language'])
+                if is_summary_error(summary):
+                    print(f"Summary failed for {result['path']}: {summary}")
+                    failed += 1
+                    continue
+
+                rows.append({
+                    "user_id": result['user_id'],
+                    "source_path": result['path'],
+                    "summary_id": result['summary_id'],
+                    "summary_text": summary,
+                    "analysis_text": analysis,
+                    "language": result['language'],
+                    "model_version": findings.get('model_version') if findings else None,
+                    "updated_at": datetime.datetime.utcnow().isoformat() + 'Z',
+                })
+                row_keys.append(checkpoint_key(result['user_id'], result['path']))
+
+                if len(rows) >= args.write_batch:
+                    written += flush(supabase, rows, row_keys, args.checkpoint, args.dry_run)
+                    rows, row_keys = [], []
+
+            elapsed = time.monotonic() - started
+            print(f"Progress: {written + len(rows)}/{len(pending)} done, {failed} failed, "
+                  f"{(written + len(rows)) / elapsed * 60:.1f} reports/min")
+
+    written += flush(supabase, rows, row_keys, args.checkpoint, args.dry_run)
+
+    elapsed = time.monotonic() - started
+    print(f"\nFinished: {written} written, {failed} failed in {elapsed:.1f}s "
+          f"({written / elapsed * 60 if elapsed else 0:.1f} reports/min)")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,10 @@ export default function ReportSummaryPage() {
   const [summary, setSummary] = useState("");
   const [loading, setLoading] = useState(false);
 
+  // Stored summary id + per-language texts, so switching language only costs a translation
+  const [summaryId, setSummaryId] = useState(null);
+  const [translations, setTranslations] = useState({});
+
   // Profile dropdown
   const [isMenuOpen, setIsMenuOpen] = useState(false);
 
@@ -66,6 +70,8 @@ export default function ReportSummaryPage() {
 
       if (response.ok) {
         setSummary(data.summary);
+        setSummaryId(data.summary_id);
+        setTranslations({ [language]: data.summary });
       } else {
         alert(data.error || "Analysis failed");
       }
@@ -77,6 +83,46 @@ export default function ReportSummaryPage() {
     }
   };
 
+  const handleLanguageChange = async (newLanguage) => {
+    setLanguage(newLanguage);
+    if (!summaryId) return;
+
+    if (translations[newLanguage]) {
+      setSummary(translations[newLanguage]);
+      return;
+    }
+
+    setLoading(true);
+    try {
+      const response = await fetch(
+        `http://localhost:5000/summaries/${summaryId}/translate`,
+        {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            token: localStorage.getItem("token"),
+          },
+          body: JSON.stringify({ language: newLanguage }),
+        }
+      );
+
+      const data = await response.json();
+
+      if (response.ok) {
+        const text = data.translations[newLanguage];
+        setTranslations((prev) => ({ ...prev, [newLanguage]: text }));
+        setSummary(text);
+      } else {
+        alert(data.error || "Translation failed");
+      }
+    } catch (error) {
+      console.error("Error translating summary:", error);
+      alert("Failed to connect to the server.");
+    } finally {
+      setLoading(false);
+    }
+  };
+
   function handleCompare(summaries) {
     setSelectedSummaries(summaries);
     setCompareMode(true);
@@ -195,7 +241,7 @@ export default function ReportSummaryPage() {
                   />
                   <LanguageSelector
                     language={language}
-                    onLanguageChange={setLanguage}
+                    onLanguageChange={handleLanguageChange}
                   />
                   <SummaryGenerator
                     loading={loading}